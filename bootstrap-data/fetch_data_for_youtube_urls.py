@@ -2,27 +2,95 @@
 Script to fetch metadata from YouTube URLs using the YouTube Data API.
 Input: Text file with one YouTube URL per line
 Output: JSON file with metadata for each URL
+
+Can also be imported; fetch_metadata(urls) returns the same data as a dict.
 """
 
 import os
 import sys
 import json
 import re
-from typing import Dict, Any, Optional, List, Tuple
-from urllib.parse import urlparse, parse_qs
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import chain
+from pathlib import Path
+from typing import Dict, Any, Iterable, Iterator, Optional, List, Tuple
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 from dotenv import load_dotenv
 
+from ingest_json_to_table import NDJSON_SUFFIXES
+
+# The API accepts at most 50 IDs per list call and 50 calls per batch request
+API_BATCH_SIZE = 50
+
+# Fetched metadata is cached on disk, keyed by "<kind>:<youtube id>"
+CACHE_PATH = Path.home() / ".cache" / "selfselecter" / "yt_meta.json"
+
+# Cache entries kept on disk; the oldest are evicted beyond this
+CACHE_MAX_ENTRIES = 4096
+
+# Matches youtu.be/<id> and [www.|music.]youtube.com/watch?...v=<id>, /playlist?...list=<id>
+# or /channel/<id>; anchored at the start of the URL so the host must be YouTube's
+YOUTUBE_URL_RE = re.compile(
+    r'(?:https?://)?(?:[\w-]+\.)*(?:'
+    r'(?:youtu\.be/|youtube\.com/watch\?(?:[^&]*&)*v=)(?P<video>[\w-]{11})'
+    r'|youtube\.com/playlist\?(?:[^&]*&)*list=(?P<playlist>[\w-]+)'
+    r'|youtube\.com/channel/(?P<channel>[\w-]+)'
+    r')'
+)
+
+# Splits "Artist - Album", "Artist: Album" or "Artist 'Album'", preferring that order
+ALBUM_TITLE_RE = re.compile(r"(.*?) - (.*)|(.*?): (.*)|(.*?)'(.*)", re.DOTALL)
+
+# Concurrent API batches; each worker thread gets its own client
+MAX_FETCH_WORKERS = 8
+
+_thread_local = threading.local()
+_metadata_cache: Optional[Dict[str, Dict[str, Any]]] = None
+
 def get_youtube_api_key() -> str:
     """Get YouTube API key from environment variable."""
     load_dotenv()
     api_key = os.getenv('YOUTUBE_API_KEY')
     if not api_key:
-        print("Error: YOUTUBE_API_KEY environment variable not set")
-        sys.exit(1)
+        raise RuntimeError("YOUTUBE_API_KEY environment variable not set")
     return api_key
 
+def get_youtube_client():
+    """Get this thread's YouTube API client, building it on first use.
+
+    Clients share an httplib2.Http that is not thread-safe, so each thread gets its own.
+    """
+    youtube = getattr(_thread_local, 'youtube', None)
+    if youtube is None:
+        youtube = _thread_local.youtube = build('youtube', 'v3', developerKey=get_youtube_api_key())
+    return youtube
+
+def load_metadata_cache() -> Dict[str, Dict[str, Any]]:
+    """Load the on-disk metadata cache, once per process."""
+    global _metadata_cache
+    if _metadata_cache is None:
+        try:
+            with open(CACHE_PATH, 'r') as f:
+                _metadata_cache = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            _metadata_cache = {}
+    return _metadata_cache
+
+def save_metadata_cache() -> None:
+    """Write the metadata cache back to disk, evicting the oldest entries beyond CACHE_MAX_ENTRIES."""
+    if _metadata_cache is None:
+        return
+    # Entries are kept in insertion order, so the oldest come first
+    for key in list(_metadata_cache)[:-CACHE_MAX_ENTRIES]:
+        del _metadata_cache[key]
+    CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = CACHE_PATH.with_suffix(".tmp")
+    with open(temp_path, 'w') as f:
+        json.dump(_metadata_cache, f)
+    temp_path.replace(CACHE_PATH)
+
 def clean_artist_name(name: str) -> str:
     """Clean artist name by removing YouTube-specific suffixes."""
     if not name:
@@ -36,22 +104,17 @@ def cap_description(description: str) -> str:
         return description
     return description[:80]
 
+def classify_url(url: str) -> Optional[Tuple[str, str]]:
+    """Return (kind, id) for a YouTube URL, where kind is 'video', 'playlist' or 'channel'."""
+    match = YOUTUBE_URL_RE.match(url)
+    if not match:
+        return None
+    return match.lastgroup, match.group(match.lastgroup)
+
 def extract_video_id(url: str) -> Optional[str]:
     """Extract video ID from various YouTube URL formats."""
-    # Handle youtu.be URLs
-    if 'youtu.be' in url:
-        return url.split('/')[-1].split('?')[0]
-    
-    # Handle youtube.com URLs
-    parsed_url = urlparse(url)
-    if 'youtube.com' in parsed_url.netloc or 'music.youtube.com' in parsed_url.netloc:
-        if 'watch' in parsed_url.path:
-            return parse_qs(parsed_url.query).get('v', [None])[0]
-        elif 'playlist' in parsed_url.path:
-            return parse_qs(parsed_url.query).get('list', [None])[0]
-        elif 'channel' in parsed_url.path:
-            return parsed_url.path.split('/')[-1]
-    return None
+    classified = classify_url(url)
+    return classified[1] if classified else None
 
 def parse_album_info(title: str, tracks_metadata: List[Dict[str, Any]] = None) -> Tuple[str, str, str]:
     """Parse album title to extract album name and artist name."""
@@ -69,287 +132,343 @@ def parse_album_info(title: str, tracks_metadata: List[Dict[str, Any]] = None) -
         return "Album", title, None
     
     # Try to extract artist name from the title
-    # Common patterns:
+    # Common patterns, in order of preference:
     # 1. "Artist - Album Name"
     # 2. "Artist: Album Name"
     # 3. "Artist 'Album Name'"
-    artist_name = None
-    album_name = title
-    
-    # Pattern 1: "Artist - Album Name"
-    if " - " in title:
-        parts = title.split(" - ", 1)
-        if len(parts) == 2:
-            artist_name = parts[0].strip()
-            album_name = parts[1].strip()
-            return "Album", album_name, artist_name
-    
-    # Pattern 2: "Artist: Album Name"
-    elif ": " in title:
-        parts = title.split(": ", 1)
-        if len(parts) == 2:
-            artist_name = parts[0].strip()
-            album_name = parts[1].strip()
-            return "Album", album_name, artist_name
-    
-    # Pattern 3: "Artist 'Album Name'"
-    elif "'" in title:
-        parts = title.split("'", 1)
-        if len(parts) == 2:
-            artist_name = parts[0].strip()
-            album_name = parts[1].strip("' ")
-            return "Album", album_name, artist_name
+    match = ALBUM_TITLE_RE.fullmatch(title)
+    if match:
+        artist_name = match.group(match.lastindex - 1).strip()
+        # Pattern 3 leaves the album name wrapped in quotes
+        album_name = match.group(match.lastindex).strip("' " if match.lastindex == 6 else None)
+        return "Album", album_name, artist_name
     
     # If we get here, it's likely a playlist
     return "Playlist", title, None
 
-def clean_tags(tags: List[str], title: str = None, artist_name: str = None, tracks: List[Dict[str, Any]] = None, is_playlist: bool = False) -> List[str]:
-    """Clean tags by removing 'Music', song titles, and artist names."""
-    cleaned_tags = set()
+def clean_tags(tags: Iterable[str], title: str = None, artist_name: str = None, tracks: List[Dict[str, Any]] = None, is_playlist: bool = False) -> List[str]:
+    """Clean tags by removing duplicates, 'Music', song titles, and artist names."""
+    # Lowercased values to drop: 'Music', the title, the artist name (only for playlists)
+    # and any track title
+    excluded_lc = {'music'}
+    if title:
+        excluded_lc.add(title.lower())
+    if is_playlist and artist_name:
+        excluded_lc.add(artist_name.lower())
+    if tracks:
+        excluded_lc.update(track['title'].lower() for track in tracks)
+    
+    seen = set()
+    cleaned_tags = []
     for tag in tags:
-        # Skip empty tags
-        if not tag or not tag.strip():
-            continue
-            
-        # Skip 'Music' tag
-        if tag.lower() == 'music':
+        if not tag:
             continue
-            
-        # Skip if tag is the title
-        if title and tag.lower() == title.lower():
-            continue
-            
-        # Skip if tag is the artist name (only for playlists)
-        if is_playlist and artist_name and tag.lower() == artist_name.lower():
+        
+        # Lowercase each tag once; skip empty and excluded tags
+        lc = tag.lower()
+        if not lc.strip() or lc in excluded_lc:
             continue
-            
-        # Skip if tag matches any track title
-        if tracks:
-            if any(tag.lower() == track['title'].lower() for track in tracks):
-                continue
-            
-        cleaned_tags.add(tag)
+        
+        if tag not in seen:
+            seen.add(tag)
+            cleaned_tags.append(tag)
     
-    return list(cleaned_tags)
+    return cleaned_tags
 
-def get_video_metadata(youtube, video_id: str) -> Dict[str, Any]:
-    """Fetch metadata for a video using YouTube API."""
-    try:
-        request = youtube.videos().list(
-            part="snippet,contentDetails,statistics,topicDetails",
-            id=video_id
-        )
-        response = request.execute()
+def chunked(items: List[str], size: int = API_BATCH_SIZE) -> Iterator[List[str]]:
+    """Split items into lists of at most `size` elements."""
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def get_topic_categories(item: Dict[str, Any]) -> List[str]:
+    """Extract readable topic category names from an API item, if available."""
+    if 'topicDetails' not in item:
+        return []
+    topic_details = item['topicDetails']
+    if 'topicCategories' not in topic_details:
+        return []
+    # Extract the last part of the URL which is the category name
+    return [
+        url.split('/')[-1].replace('_', ' ').title()
+        for url in topic_details['topicCategories']
+    ]
+
+def get_videos_metadata(youtube, video_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Fetch metadata for many videos, up to 50 IDs per API call."""
+    results = {}
+    for chunk in chunked(video_ids):
+        try:
+            request = youtube.videos().list(
+                part="snippet,contentDetails,statistics,topicDetails",
+                id=','.join(chunk)
+            )
+            response = request.execute()
+        except HttpError as e:
+            for video_id in chunk:
+                results[video_id] = {"error": f"API Error: {str(e)}"}
+            continue
         
-        if not response['items']:
-            return {"error": "Video not found"}
+        for video in response.get('items', []):
+            snippet = video['snippet']
             
-        video = response['items'][0]
-        snippet = video['snippet']
-        content_details = video['contentDetails']
-        
-        # Extract topic categories if available
-        topic_categories = []
-        if 'topicDetails' in video:
-            topic_details = video['topicDetails']
-            if 'topicCategories' in topic_details:
-                # Extract the last part of the URL which is the category name
-                topic_categories = [
-                    url.split('/')[-1].replace('_', ' ').title()
-                    for url in topic_details['topicCategories']
-                ]
-        
-        # Combine all tags
-        tags = set(snippet.get('tags', []))
-        tags.update(topic_categories)
-        
-        # Clean tags
-        cleaned_tags = clean_tags(list(tags), snippet['title'], clean_artist_name(snippet.get('channelTitle')))
-        
-        return {
-            "type": "Video",
-            "name": snippet['title'],
-            "artist_name": clean_artist_name(snippet.get('channelTitle')),
-            "youtube_id": video_id,
-            "description": cap_description(snippet.get('description')),
-            "tags": cleaned_tags
-        }
-    except HttpError as e:
-        return {"error": f"API Error: {str(e)}"}
-
-def get_playlist_tracks_metadata(youtube, playlist_id: str, max_tracks: int = 3) -> List[Dict[str, Any]]:
-    """Fetch metadata for the first few tracks in a playlist."""
-    try:
-        # First get the playlist items
-        playlist_items_request = youtube.playlistItems().list(
-            part="snippet",
-            playlistId=playlist_id,
-            maxResults=max_tracks
-        )
-        playlist_items_response = playlist_items_request.execute()
-        
-        if not playlist_items_response.get('items'):
-            return []
+            # Combine all tags
+            tags = chain(snippet.get('tags') or (), get_topic_categories(video))
+            
+            # Clean tags
+            cleaned_tags = clean_tags(tags, snippet['title'], clean_artist_name(snippet.get('channelTitle')))
             
-        # Get video IDs from playlist items
-        video_ids = [item['snippet']['resourceId']['videoId'] for item in playlist_items_response['items']]
+            results[video['id']] = {
+                "type": "Video",
+                "name": snippet['title'],
+                "artist_name": clean_artist_name(snippet.get('channelTitle')),
+                "youtube_id": video['id'],
+                "description": cap_description(snippet.get('description')),
+                "tags": cleaned_tags
+            }
         
-        # Get detailed video information
-        videos_request = youtube.videos().list(
-            part="snippet,topicDetails",
-            id=','.join(video_ids)
-        )
-        videos_response = videos_request.execute()
+        for video_id in chunk:
+            results.setdefault(video_id, {"error": "Video not found"})
+    return results
+
+def get_playlists_tracks_metadata(youtube, playlist_ids: List[str], max_tracks: int = 3) -> Dict[str, List[Dict[str, Any]]]:
+    """Fetch metadata for the first few tracks of many playlists, keyed by playlist ID."""
+    # First get the playlist items, one batched HTTP request per 50 playlists
+    video_ids_by_playlist = {}
+    
+    def store_playlist_items(request_id, response, exception):
+        if exception is not None:
+            print(f"Error fetching playlist tracks: {str(exception)}")
+            return
+        video_ids_by_playlist[request_id] = [
+            item['snippet']['resourceId']['videoId'] for item in response.get('items', [])
+        ]
+    
+    for chunk in chunked(playlist_ids):
+        batch = youtube.new_batch_http_request(callback=store_playlist_items)
+        for playlist_id in chunk:
+            batch.add(
+                youtube.playlistItems().list(
+                    part="snippet",
+                    playlistId=playlist_id,
+                    maxResults=max_tracks
+                ),
+                request_id=playlist_id
+            )
+        try:
+            batch.execute()
+        except HttpError as e:
+            print(f"Error fetching playlist tracks: {str(e)}")
+    
+    # Get detailed video information for all tracks, up to 50 IDs per call
+    all_video_ids = list(dict.fromkeys(
+        video_id for video_ids in video_ids_by_playlist.values() for video_id in video_ids
+    ))
+    tracks_by_id = {}
+    for chunk in chunked(all_video_ids):
+        try:
+            videos_request = youtube.videos().list(
+                part="snippet,topicDetails",
+                id=','.join(chunk)
+            )
+            videos_response = videos_request.execute()
+        except HttpError as e:
+            print(f"Error fetching playlist tracks: {str(e)}")
+            continue
         
-        tracks_metadata = []
         for video in videos_response.get('items', []):
             snippet = video['snippet']
             
-            # Extract topic categories if available
-            topic_categories = []
-            if 'topicDetails' in video:
-                topic_details = video['topicDetails']
-                if 'topicCategories' in topic_details:
-                    topic_categories = [
-                        url.split('/')[-1].replace('_', ' ').title()
-                        for url in topic_details['topicCategories']
-                    ]
-            
             # Combine all tags
-            tags = set(snippet.get('tags', []))
-            tags.update(topic_categories)
+            tags = list(chain(snippet.get('tags') or (), get_topic_categories(video)))
             
-            tracks_metadata.append({
+            tracks_by_id[video['id']] = {
                 "title": snippet['title'],
                 "artist_name": clean_artist_name(snippet.get('channelTitle')),
                 "youtube_id": video['id'],
                 "description": snippet.get('description'),
-                "tags": list(tags)
-            })
-            
-        return tracks_metadata
-    except HttpError as e:
-        print(f"Error fetching playlist tracks: {str(e)}")
-        return []
+                "tags": tags
+            }
+    
+    return {
+        playlist_id: [tracks_by_id[video_id] for video_id in video_ids if video_id in tracks_by_id]
+        for playlist_id, video_ids in video_ids_by_playlist.items()
+    }
 
-def get_playlist_metadata(youtube, playlist_id: str) -> Dict[str, Any]:
-    """Fetch metadata for a playlist using YouTube API."""
-    try:
-        request = youtube.playlists().list(
-            part="snippet,contentDetails",
-            id=playlist_id
-        )
-        response = request.execute()
-        
-        if not response['items']:
-            return {"error": "Playlist not found"}
-            
-        playlist = response['items'][0]
-        snippet = playlist['snippet']
-        
-        # Get metadata for first 3 tracks to help with album detection
-        tracks_metadata = get_playlist_tracks_metadata(youtube, playlist_id)
-        
-        # Combine tags from all tracks
-        all_tags = set()
-        for track in tracks_metadata:
-            all_tags.update(track['tags'])
-        
-        # Check if this is an album
-        content_type, name, artist_name = parse_album_info(snippet['title'], tracks_metadata)
-        
-        # If we couldn't determine the artist from the title, try to get it from the tracks
-        if not artist_name and tracks_metadata and content_type == "Album":
-            # Look for consistent artist names in tracks
-            track_artists = [track['artist_name'] for track in tracks_metadata if track['artist_name']]
-            if track_artists and all(artist == track_artists[0] for artist in track_artists):
-                artist_name = track_artists[0]
+def get_playlists_metadata(youtube, playlist_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Fetch metadata for many playlists, up to 50 IDs per API call."""
+    results = {}
+    for chunk in chunked(playlist_ids):
+        try:
+            request = youtube.playlists().list(
+                part="snippet,contentDetails",
+                id=','.join(chunk),
+                maxResults=len(chunk)  # Defaults to 5 for this endpoint
+            )
+            response = request.execute()
+        except HttpError as e:
+            for playlist_id in chunk:
+                results[playlist_id] = {"error": f"API Error: {str(e)}"}
+            continue
         
-        # Clean tags
-        cleaned_tags = clean_tags(list(all_tags), name, artist_name, tracks_metadata, is_playlist=True)
+        snippets = {playlist['id']: playlist['snippet'] for playlist in response.get('items', [])}
         
-        return {
-            "type": content_type,
-            "name": name,
-            "artist_name": clean_artist_name(artist_name or snippet.get('channelTitle')),
-            "youtube_id": playlist_id,
-            "description": cap_description(snippet.get('description')),
-            "tags": cleaned_tags
-        }
-    except HttpError as e:
-        return {"error": f"API Error: {str(e)}"}
-
-def get_artist_metadata(youtube, channel_id: str) -> Dict[str, Any]:
-    """Fetch metadata for an artist channel using YouTube API."""
-    try:
-        request = youtube.channels().list(
-            part="snippet,statistics",
-            id=channel_id
-        )
-        response = request.execute()
+        # Get metadata for first 3 tracks of each playlist to help with album detection
+        tracks_by_playlist = get_playlists_tracks_metadata(youtube, list(snippets))
         
-        if not response['items']:
-            return {"error": "Artist channel not found"}
+        for playlist_id in chunk:
+            if playlist_id not in snippets:
+                results[playlist_id] = {"error": "Playlist not found"}
+                continue
+            snippet = snippets[playlist_id]
+            tracks_metadata = tracks_by_playlist.get(playlist_id, [])
             
-        channel = response['items'][0]
-        snippet = channel['snippet']
-        
-        # Extract topic categories if available
-        topic_categories = []
-        if 'topicDetails' in channel:
-            topic_details = channel['topicDetails']
-            if 'topicCategories' in topic_details:
-                topic_categories = [
-                    url.split('/')[-1].replace('_', ' ').title()
-                    for url in topic_details['topicCategories']
-                ]
-        
-        # Combine all tags
-        tags = set(snippet.get('tags', []))
-        tags.update(topic_categories)
+            # Combine tags from all tracks
+            all_tags = chain.from_iterable(track['tags'] for track in tracks_metadata)
+            
+            # Check if this is an album
+            content_type, name, artist_name = parse_album_info(snippet['title'], tracks_metadata)
+            
+            # If we couldn't determine the artist from the title, try to get it from the tracks
+            if not artist_name and tracks_metadata and content_type == "Album":
+                # Look for consistent artist names in tracks
+                track_artists = [track['artist_name'] for track in tracks_metadata if track['artist_name']]
+                if track_artists and all(artist == track_artists[0] for artist in track_artists):
+                    artist_name = track_artists[0]
+            
+            # Clean tags
+            cleaned_tags = clean_tags(all_tags, name, artist_name, tracks_metadata, is_playlist=True)
+            
+            results[playlist_id] = {
+                "type": content_type,
+                "name": name,
+                "artist_name": clean_artist_name(artist_name or snippet.get('channelTitle')),
+                "youtube_id": playlist_id,
+                "description": cap_description(snippet.get('description')),
+                "tags": cleaned_tags
+            }
+    return results
+
+def get_artists_metadata(youtube, channel_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Fetch metadata for many artist channels, up to 50 IDs per API call."""
+    results = {}
+    for chunk in chunked(channel_ids):
+        try:
+            request = youtube.channels().list(
+                part="snippet,statistics",
+                id=','.join(chunk),
+                maxResults=len(chunk)  # Defaults to 5 for this endpoint
+            )
+            response = request.execute()
+        except HttpError as e:
+            for channel_id in chunk:
+                results[channel_id] = {"error": f"API Error: {str(e)}"}
+            continue
         
-        # Clean tags
-        cleaned_tags = clean_tags(list(tags), snippet['title'])
+        for channel in response.get('items', []):
+            snippet = channel['snippet']
+            
+            # Combine all tags
+            tags = chain(snippet.get('tags') or (), get_topic_categories(channel))
+            
+            # Clean tags
+            cleaned_tags = clean_tags(tags, snippet['title'])
+            
+            # Clean artist name by removing "Topic" suffix
+            artist_name = clean_artist_name(snippet['title'])
+            
+            results[channel['id']] = {
+                "type": "Artist",
+                "name": artist_name,
+                "youtube_id": channel['id'],
+                "description": cap_description(snippet.get('description')),
+                "tags": cleaned_tags
+            }
         
-        # Clean artist name by removing "Topic" suffix
-        artist_name = clean_artist_name(snippet['title'])
+        for channel_id in chunk:
+            results.setdefault(channel_id, {"error": "Artist channel not found"})
+    return results
+
+METADATA_FETCHERS = {
+    "playlist": get_playlists_metadata,
+    "channel": get_artists_metadata,
+    "video": get_videos_metadata,
+}
+
+def iter_metadata(urls: List[str]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """Yield (url, metadata) pairs as each batch of lookups completes."""
+    cache = load_metadata_cache()
+    cache_updated = False
+    
+    # Determine if each URL is a playlist, video, or artist channel;
+    # cached and invalid URLs are answered right away
+    pending_ids = {kind: [] for kind in METADATA_FETCHERS}
+    urls_by_key = {}
+    for url in dict.fromkeys(urls):
+        classified = classify_url(url)
+        if not classified:
+            yield url, {"error": "Invalid YouTube URL"}
+            continue
         
-        return {
-            "type": "Artist",
-            "name": artist_name,
-            "youtube_id": channel_id,
-            "description": cap_description(snippet.get('description')),
-            "tags": cleaned_tags
-        }
-    except HttpError as e:
-        return {"error": f"API Error: {str(e)}"}
+        kind, video_id = classified
+        key = f"{kind}:{video_id}"
+        if key in cache:
+            yield url, dict(cache[key])
+            continue
+        if key not in urls_by_key:
+            pending_ids[kind].append(video_id)
+        urls_by_key.setdefault(key, []).append(url)
+    
+    def fetch_chunk(kind: str, chunk: List[str]) -> Dict[str, Dict[str, Any]]:
+        return METADATA_FETCHERS[kind](get_youtube_client(), chunk)
+    
+    # Fetch batches concurrently; the cache is only touched from this thread
+    try:
+        with ThreadPoolExecutor(max_workers=MAX_FETCH_WORKERS) as executor:
+            futures = {
+                executor.submit(fetch_chunk, kind, chunk): kind
+                for kind, video_ids in pending_ids.items()
+                for chunk in chunked(video_ids)
+            }
+            for future in as_completed(futures):
+                kind = futures[future]
+                for video_id, metadata in future.result().items():
+                    key = f"{kind}:{video_id}"
+                    if "error" not in metadata:
+                        cache[key] = metadata
+                        cache_updated = True
+                    for url in urls_by_key[key]:
+                        yield url, dict(metadata)
+    finally:
+        if cache_updated:
+            save_metadata_cache()
+
+def fetch_metadata(urls: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Fetch metadata for each URL, keyed by URL in input order."""
+    results = dict(iter_metadata(urls))
+    return {url: results[url] for url in urls}
 
 def process_urls(input_file: str, output_file: str):
-    """Process URLs from input file and save metadata to output file."""
-    youtube = build('youtube', 'v3', developerKey=get_youtube_api_key())
-    results = {}
+    """Process URLs from input file and stream metadata to output file.
     
+    Output files ending in .jsonl or .ndjson get one {"url", "metadata"} object per line;
+    anything else gets a single JSON object keyed by URL.
+    """
     with open(input_file, 'r') as f:
         urls = [line.strip() for line in f if line.strip()]
     
-    for url in urls:
-        video_id = extract_video_id(url)
-        if not video_id:
-            results[url] = {"error": "Invalid YouTube URL"}
-            continue
-            
-        # Determine if it's a playlist, video, or artist channel
-        if 'playlist' in url:
-            metadata = get_playlist_metadata(youtube, video_id)
-        elif 'channel' in url:
-            metadata = get_artist_metadata(youtube, video_id)
-        else:
-            metadata = get_video_metadata(youtube, video_id)
-            
-        results[url] = metadata
-    
     with open(output_file, 'w') as f:
-        json.dump(results, f, indent=2)
+        if output_file.endswith(NDJSON_SUFFIXES):
+            for url, metadata in iter_metadata(urls):
+                f.write(json.dumps({"url": url, "metadata": metadata}) + "\n")
+            return
+        
+        # Write the JSON object one entry at a time, formatted like json.dump(indent=2)
+        f.write("{")
+        for i, (url, metadata) in enumerate(iter_metadata(urls)):
+            entry = json.dumps(metadata, indent=2).replace("\n", "\n  ")
+            f.write(",\n  " if i else "\n  ")
+            f.write(f"{json.dumps(url)}: {entry}")
+        f.write("\n}" if urls else "}")
 
 def main():
     if len(sys.argv) != 3:
@@ -363,7 +482,11 @@ def main():
         print(f"Error: Input file '{input_file}' not found")
         sys.exit(1)
         
-    process_urls(input_file, output_file)
+    try:
+        process_urls(input_file, output_file)
+    except RuntimeError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
     print(f"Metadata has been saved to {output_file}")
 
 if __name__ == "__main__":
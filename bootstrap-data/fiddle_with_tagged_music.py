@@ -2,90 +2,135 @@
 """
 Script to manage music content in SQLite database.
 Commands:
-1. add <url> [tags] - Add a URL with optional tags
+1. add <url1,url2,...> [tags] - Add one or more URLs with optional tags
 2. list [--limit N] [--recent] [--untagged] - List content with options
 3. tag <id> <tags> - Add tags to an entry by ID
 4. play <id> - Open the appropriate YouTube Music URL for the given content ID
 """
 
+import io
 import os
 import sys
-import json
+import atexit
 import sqlite3
-import subprocess
 from typing import List, Optional
-from datetime import datetime
-from urllib.parse import urlparse
 
-def get_db_connection(db_path: str) -> sqlite3.Connection:
-    """Get SQLite database connection."""
-    return sqlite3.connect(db_path)
+from ingest_json_to_table import ingest
+from music_schema import migrate_schema
 
-def add_url(db_path: str, url: str, tags: Optional[str] = None) -> None:
-    """Add a URL to the database, processing it through the pipeline."""
-    # Create temporary files for the pipeline
-    temp_input = "temp_urls.txt"
-    temp_json = "temp_metadata.json"
-    temp_sql = "temp_insert.sql"
+DB_PATH = "music.db"  # Default database path
+
+# Rebuilds raw_tags for the music_content row being updated
+RAW_TAGS_SQL = """
+    SELECT group_concat(tag.name, ',')
+    FROM music_content_tag JOIN tag ON tag.id = music_content_tag.tag_id
+    WHERE music_content_tag.content_id = music_content.id
+"""
+
+_conn: Optional[sqlite3.Connection] = None
+
+def get_db_connection() -> sqlite3.Connection:
+    """Get the shared SQLite database connection, opening and tuning it on first use."""
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect(DB_PATH)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute("PRAGMA synchronous=NORMAL")
+        _conn.execute("PRAGMA temp_store=MEMORY")
+        _conn.execute("PRAGMA cache_size=-65536")  # 64 MiB
+        _conn.row_factory = sqlite3.Row
+        # Bring older databases up to date with the schema
+        migrate_schema(_conn)
+        atexit.register(close_db_connection)
+    return _conn
+
+def close_db_connection() -> None:
+    """Close the shared database connection, if open."""
+    global _conn
+    if _conn is not None:
+        _conn.close()
+        _conn = None
+
+def parse_tags(tags: str) -> List[str]:
+    """Split a comma-separated tag string, dropping blanks and duplicates."""
+    return list(dict.fromkeys(tag.strip() for tag in tags.split(',') if tag.strip()))
+
+def tag_content(cursor: sqlite3.Cursor, ids: List[int], tags: List[str]) -> None:
+    """Link tags to content IDs, then refresh raw_tags as the display copy."""
+    cursor.executemany("INSERT OR IGNORE INTO tag (name) VALUES (?)", [(tag,) for tag in tags])
+    cursor.executemany(
+        "INSERT OR IGNORE INTO music_content_tag (content_id, tag_id) SELECT ?, id FROM tag WHERE name = ?",
+        [(id, tag) for id in ids for tag in tags]
+    )
+    placeholders = ','.join('?' * len(ids))
+    cursor.execute(f"""
+        UPDATE music_content 
+        SET raw_tags = ({RAW_TAGS_SQL}), updated_at = CURRENT_TIMESTAMP
+        WHERE id IN ({placeholders})
+    """, ids)
+
+def add_url(urls: List[str], tags: Optional[str] = None) -> None:
+    """Add URLs to the database, fetching their metadata in-process."""
+    # Imported here so the other commands don't load the YouTube API client
+    from fetch_data_for_youtube_urls import extract_video_id, fetch_metadata
     
     try:
-        # Write URL to temp file
-        with open(temp_input, 'w') as f:
-            f.write(url + '\n')
+        conn = get_db_connection()
         
-        # Run fetch_data_for_youtube_urls.py
-        subprocess.run(['python3', 'fetch_data_for_youtube_urls.py', temp_input, temp_json], check=True)
-        
-        # Read the JSON data
-        with open(temp_json, 'r') as f:
-            data = json.load(f)
-        
-        # Get the metadata for our URL
-        if url not in data:
-            print(f"Error: Could not fetch metadata for {url}")
-            return
-            
-        metadata = data[url]
-        if "error" in metadata:
-            print(f"Error: {metadata['error']}")
-            return
-        
-        # Add any provided tags
-        if tags:
-            metadata['tags'] = metadata.get('tags', []) + [tag.strip() for tag in tags.split(',')]
-        
-        # Write the modified data back to JSON
-        with open(temp_json, 'w') as f:
-            json.dump({url: metadata}, f)
+        # Skip the API for anything already stored; its row is reused for tagging
+        known_ids = {row['youtube_id']: row['id'] for row in conn.execute("SELECT id, youtube_id FROM music_content")}
+        content_ids = []
+        new_urls = []
+        for url in urls:
+            youtube_id = extract_video_id(url)
+            if youtube_id in known_ids:
+                print(f"Already in database: {url}")
+                content_ids.append(known_ids[youtube_id])
+            else:
+                new_urls.append(url)
         
-        # Run ingest_json_to_table.py to generate SQL
-        with open(temp_sql, 'w') as f:
-            subprocess.run(['python3', 'ingest_json_to_table.py', temp_json], stdout=f, check=True)
+        data = fetch_metadata(new_urls) if new_urls else {}
         
-        # Execute the generated SQL
-        conn = get_db_connection(db_path)
-        cursor = conn.cursor()
+        # Key by youtube_id so different URLs for the same content are added once
+        valid = {}
+        for url in new_urls:
+            metadata = data.get(url)
+            if metadata is None:
+                print(f"Error: Could not fetch metadata for {url}")
+                continue
+            if "error" in metadata:
+                print(f"Error: {metadata['error']} ({url})")
+                continue
+            valid[metadata['youtube_id']] = metadata
         
-        with open(temp_sql, 'r') as f:
-            sql = f.read()
-            cursor.executescript(sql)
+        if valid:
+            last_known_id = max(known_ids.values(), default=0)
+            inserted = ingest(conn, valid)
+            
+            # IDs only grow (AUTOINCREMENT), so rows past last_known_id were created by this insert
+            placeholders = ','.join('?' * len(valid))
+            rows = conn.execute(
+                f"SELECT id, name FROM music_content WHERE youtube_id IN ({placeholders})", list(valid)
+            ).fetchall()
+            for row in rows:
+                if row['id'] > last_known_id:
+                    print(f"Added {row['name']} to database")
+            if inserted < len(valid):
+                print(f"Skipped {len(valid) - inserted} already in database")
+            
+            content_ids.extend(row['id'] for row in rows)
         
-        conn.commit()
-        print(f"Added {metadata['name']} to database")
+        # Apply any provided tags; ingest ignores the fetched YouTube tags
+        if tags and content_ids:
+            with conn:
+                tag_content(conn.cursor(), content_ids, parse_tags(tags))
         
-    except subprocess.CalledProcessError as e:
-        print(f"Error running pipeline: {e}")
     except Exception as e:
         print(f"Error: {e}")
-    finally:
-        # Clean up temp files
-        for temp_file in [temp_input, temp_json, temp_sql]:
-            if os.path.exists(temp_file):
-                os.remove(temp_file)
 
-def list_content(db_path: str, limit: int = 20, recent: bool = False, untagged: bool = False) -> None:
+def list_content(limit: int = 20, recent: bool = False, untagged: bool = False) -> None:
     """List content from the database with various options."""
-    conn = get_db_connection(db_path)
+    conn = get_db_connection()
     cursor = conn.cursor()
     
     # Build the query
@@ -93,7 +138,7 @@ def list_content(db_path: str, limit: int = 20, recent: bool = False, untagged:
     conditions = []
     
     if untagged:
-        conditions.append("(raw_tags IS NULL OR raw_tags = '')")
+        conditions.append("is_untagged = 1")
     
     if conditions:
         query += " WHERE " + " AND ".join(conditions)
@@ -101,10 +146,10 @@ def list_content(db_path: str, limit: int = 20, recent: bool = False, untagged:
     if recent:
         query += " ORDER BY created_at DESC"
     
-    query += f" LIMIT {limit}"
+    query += " LIMIT ?"
     
     # Execute query
-    cursor.execute(query)
+    cursor.execute(query, (limit,))
     rows = cursor.fetchall()
     
     # Print results
@@ -112,44 +157,34 @@ def list_content(db_path: str, limit: int = 20, recent: bool = False, untagged:
         print("No content found")
         return
         
-    print("\nID | Type | Name | Artist | Tags | Created At")
-    print("-" * 80)
+    # Buffer the table and write it with a single call
+    out = io.StringIO()
+    out.write("\nID | Type | Name | Artist | Tags | Created At\n")
+    out.write("-" * 80 + "\n")
     for row in rows:
-        id, type, name, artist, tags, created = row
-        print(f"{id} | {type} | {name} | {artist or 'N/A'} | {tags or 'N/A'} | {created}")
+        out.write(" | ".join("N/A" if value is None or value == "" else str(value) for value in row))
+        out.write("\n")
+    sys.stdout.write(out.getvalue())
 
-def add_tags(db_path: str, ids: List[int], tags: str) -> None:
+def add_tags(ids: List[int], tags: str) -> None:
     """Add tags to entries by IDs."""
-    conn = get_db_connection(db_path)
+    conn = get_db_connection()
     cursor = conn.cursor()
     
-    # Get current tags for all IDs
+    # Find which IDs exist
     placeholders = ','.join('?' * len(ids))
-    cursor.execute(f"SELECT id, raw_tags FROM music_content WHERE id IN ({placeholders})", ids)
-    results = cursor.fetchall()
+    cursor.execute(f"SELECT id FROM music_content WHERE id IN ({placeholders})", ids)
+    found_ids = [row['id'] for row in cursor.fetchall()]
     
-    if not results:
+    if not found_ids:
         print(f"Error: No entries found with IDs {ids}")
         return
     
-    # Process each entry
-    for id, current_tags in results:
-        current_tag_list = [tag.strip() for tag in current_tags.split(',')] if current_tags else []
-        
-        # Add new tags
-        new_tags = [tag.strip() for tag in tags.split(',')]
-        all_tags = list(set(current_tag_list + new_tags))  # Remove duplicates
-        
-        # Update the database
-        cursor.execute("""
-            UPDATE music_content 
-            SET raw_tags = ?, updated_at = CURRENT_TIMESTAMP
-            WHERE id = ?
-        """, (','.join(all_tags), id))
-        
-        print(f"Updated tags for ID {id}")
+    with conn:
+        tag_content(cursor, found_ids, parse_tags(tags))
     
-    conn.commit()
+    for id in found_ids:
+        print(f"Updated tags for ID {id}")
 
 def get_youtube_music_url(content_type: str, youtube_id: str) -> str:
     """Construct the appropriate YouTube Music URL based on content type and ID."""
@@ -162,9 +197,9 @@ def get_youtube_music_url(content_type: str, youtube_id: str) -> str:
     else:  # ALBUM or PLAYLIST
         return f"{base_url}/playlist?list={youtube_id}"
 
-def play_content(db_path: str, id: int) -> None:
+def play_content(id: int) -> None:
     """Open the appropriate YouTube Music URL for the given content ID."""
-    conn = get_db_connection(db_path)
+    conn = get_db_connection()
     cursor = conn.cursor()
     
     # Get content type and YouTube ID
@@ -193,20 +228,19 @@ def main():
         sys.exit(1)
         
     command = sys.argv[1]
-    db_path = "music.db"  # Default database path
-    
     # Check if database exists
-    if not os.path.exists(db_path):
-        print(f"Error: Database '{db_path}' not found")
+    if not os.path.exists(DB_PATH):
+        print(f"Error: Database '{DB_PATH}' not found")
         sys.exit(1)
 
     if command == "add":
         if len(sys.argv) < 3:
-            print("Usage: python fiddle_with_tagged_music.py add <url> [tags]")
+            print("Usage: python fiddle_with_tagged_music.py add <url1,url2,...> [tags]")
             sys.exit(1)
-        url = sys.argv[2]
+        # Parse comma-separated URLs
+        urls = [url.strip() for url in sys.argv[2].split(',') if url.strip()]
         tags = sys.argv[3] if len(sys.argv) > 3 else None
-        add_url(db_path, url, tags)
+        add_url(urls, tags)
         
     elif command == "list":
         limit = 20
@@ -227,7 +261,7 @@ def main():
             else:
                 i += 1
                 
-        list_content(db_path, limit, recent, untagged)
+        list_content(limit, recent, untagged)
         
     elif command == "tag":
         if len(sys.argv) < 4:
@@ -237,7 +271,7 @@ def main():
             # Parse comma-separated IDs
             ids = [int(id.strip()) for id in sys.argv[2].split(',')]
             tags = sys.argv[3]
-            add_tags(db_path, ids, tags)
+            add_tags(ids, tags)
         except ValueError:
             print("Error: IDs must be numbers")
             sys.exit(1)
@@ -248,7 +282,7 @@ def main():
             sys.exit(1)
         try:
             id = int(sys.argv[2])
-            play_content(db_path, id)
+            play_content(id)
         except ValueError:
             print("Error: ID must be a number")
             sys.exit(1)
@@ -2,13 +2,17 @@
 """
 Script to convert JSON data from fetch_data_for_youtube_urls.py into SQL insert statements
 for the music_content table.
+
+Can also be imported; ingest(conn, data) inserts the same data directly.
 """
 
 import json
+import os
 import sys
 import sqlite3
-from typing import Dict, Any, List
-from datetime import datetime
+from typing import Dict, Any, Iterable, Iterator, List, Tuple, Union
+
+from music_schema import SECONDARY_INDEXES, migrate_schema
 
 def clean_type(content_type: str) -> str:
     """Convert content type to match schema constraints."""
@@ -26,54 +30,115 @@ def clean_tags(tags: List[str]) -> str:
         return ""
     return ",".join(tag.strip() for tag in tags if tag.strip())
 
-def generate_insert_statements(data: Dict[str, Any]) -> List[str]:
-    """Generate SQL insert statements from the JSON data."""
-    statements = []
-    
-    for url, metadata in data.items():
+# Either a {url: metadata} dict or a stream of (url, metadata) pairs
+JsonEntries = Union[Dict[str, Any], Iterable[Tuple[str, Dict[str, Any]]]]
+
+INSERT_COLUMNS = "(type, youtube_id, name, artist_name, description, raw_tags)"
+# Shared by in-process loads and script output, so both skip existing youtube_ids
+INSERT_PREFIX = f"INSERT OR IGNORE INTO music_content {INSERT_COLUMNS}"
+INSERT_SQL = f"{INSERT_PREFIX} VALUES (?, ?, ?, ?, ?, ?)"
+
+# Files with these suffixes hold newline-delimited JSON; fetch_data_for_youtube_urls.py writes them
+NDJSON_SUFFIXES = ('.jsonl', '.ndjson')
+
+# Rows per multi-row INSERT statement in script output
+ROWS_PER_STATEMENT = 500
+
+def iter_json_entries(input_file: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """Read (url, metadata) pairs from a JSON object file, or line by line from an NDJSON file."""
+    with open(input_file, 'r') as f:
+        if not input_file.endswith(NDJSON_SUFFIXES):
+            yield from json.load(f).items()
+            return
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                yield entry["url"], entry["metadata"]
+
+def iter_insert_rows(data: JsonEntries) -> Iterator[tuple]:
+    """Yield music_content row tuples from the JSON data, in INSERT_COLUMNS order."""
+    entries = data.items() if isinstance(data, dict) else data
+    for url, metadata in entries:
         if "error" in metadata:
             print(f"Skipping {url} due to error: {metadata['error']}", file=sys.stderr)
             continue
-            
-        # Clean and validate the data
-        content_type = clean_type(metadata["type"])
-        youtube_id = metadata["youtube_id"]
-        name = metadata["name"].replace("'", "''")  # Escape single quotes
-        artist_name = metadata.get("artist_name", "").replace("'", "''") if metadata.get("artist_name") else None
+        
         # for now: ignore description and raw tags, the quality is too low.
-        # description = metadata.get("description", "").replace("'", "''") if metadata.get("description") else None
-        # raw_tags = clean_tags(metadata.get("tags", []))
-        description = None
-        raw_tags = None
+        yield (
+            clean_type(metadata["type"]),
+            metadata["youtube_id"],
+            metadata["name"],
+            metadata.get("artist_name") or None,
+            None,
+            None
+        )
 
-        # Create the insert statement
-        statement = f"""INSERT INTO music_content 
-            (type, youtube_id, name, artist_name, description, raw_tags)
-            VALUES 
-            ('{content_type}', '{youtube_id}', '{name}', 
-            {f"'{artist_name}'" if artist_name else 'NULL'}, 
-            {f"'{description}'" if description else 'NULL'}, 
-            {f"'{raw_tags}'" if raw_tags else 'NULL'});"""
-            
-        statements.append(statement)
+def ingest(conn: sqlite3.Connection, data: JsonEntries, bulk: bool = False) -> int:
+    """Insert the JSON data into music_content in one transaction. Returns the inserted row count.
+    
+    With bulk=True, the schema is migrated first, then secondary indexes are dropped before
+    the load and rebuilt after it.
+    """
+    if bulk:
+        migrate_schema(conn)
+    with conn:
+        # sqlite3 only opens a transaction implicitly before DML; begin explicitly so the
+        # index drops roll back with a failed load
+        if not conn.in_transaction:
+            conn.execute("BEGIN")
+        if bulk:
+            for index_name in SECONDARY_INDEXES:
+                conn.execute(f"DROP INDEX IF EXISTS {index_name}")
+        changes_before = conn.total_changes
+        conn.executemany(INSERT_SQL, iter_insert_rows(data))
+        inserted = conn.total_changes - changes_before
+        if bulk:
+            for create_index in SECONDARY_INDEXES.values():
+                conn.execute(create_index)
+    return inserted
+
+def iter_insert_statements(data: JsonEntries) -> Iterator[str]:
+    """Render the JSON data as multi-row SQL insert statements, quoting values with SQLite's quote()."""
+    quoter = sqlite3.connect(":memory:")
+    select_quoted = "SELECT " + ", ".join(["quote(?)"] * 6)
+    
+    def render(row_literals: List[str]) -> str:
+        return f"{INSERT_PREFIX} VALUES\n" + ",\n".join(row_literals) + ";"
     
-    return statements
+    row_literals = []
+    for row in iter_insert_rows(data):
+        row_literals.append("(" + ", ".join(quoter.execute(select_quoted, row).fetchone()) + ")")
+        if len(row_literals) == ROWS_PER_STATEMENT:
+            yield render(row_literals)
+            row_literals = []
+    if row_literals:
+        yield render(row_literals)
+    quoter.close()
 
 def main():
-    if len(sys.argv) != 2:
-        print("Usage: python ingest_json_to_table.py <input_json_file>")
+    if len(sys.argv) not in (2, 4) or (len(sys.argv) == 4 and sys.argv[2] != "--db"):
+        print("Usage: python ingest_json_to_table.py <input_json_file> [--db <database>]")
         sys.exit(1)
         
     input_file = sys.argv[1]
     
     try:
-        with open(input_file, 'r') as f:
-            data = json.load(f)
-            
-        statements = generate_insert_statements(data)
+        data = iter_json_entries(input_file)
         
+        # Bulk load straight into a database
+        if len(sys.argv) == 4:
+            db_path = sys.argv[3]
+            if not os.path.exists(db_path):
+                print(f"Error: Database '{db_path}' not found", file=sys.stderr)
+                sys.exit(1)
+            conn = sqlite3.connect(db_path)
+            inserted = ingest(conn, data, bulk=True)
+            conn.close()
+            print(f"Inserted {inserted} rows into {db_path}", file=sys.stderr)
+            return
+            
         # Print statements to stdout
-        for statement in statements:
+        for statement in iter_insert_statements(data):
             print(statement)
             
     except FileNotFoundError:
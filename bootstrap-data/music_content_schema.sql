@@ -1,3 +1,6 @@
+-- Schema for new databases. Older databases are migrated by music_schema.py,
+-- which holds the DDL for later additions; keep the two in sync.
+
 CREATE TABLE music_content (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     type TEXT NOT NULL CHECK (type IN ('ALBUM', 'PLAYLIST', 'SONG', 'ARTIST')),
@@ -7,8 +10,27 @@ CREATE TABLE music_content (
     description TEXT,
     raw_tags TEXT,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    is_untagged INTEGER GENERATED ALWAYS AS (raw_tags IS NULL OR raw_tags = '') VIRTUAL
 );
 
 -- Create an index on type for filtering by content type
-CREATE INDEX idx_music_content_created_at ON music_content(created_at);
\ No newline at end of file
+CREATE INDEX idx_music_content_created_at ON music_content(created_at);
+
+-- Index so listing untagged content (optionally by recency) is a range scan
+CREATE INDEX idx_music_content_is_untagged ON music_content(is_untagged, created_at DESC);
+
+-- Normalized tags; music_content.raw_tags is kept as a comma-separated display copy
+CREATE TABLE tag (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+
+CREATE TABLE music_content_tag (
+    content_id INTEGER NOT NULL REFERENCES music_content(id),
+    tag_id INTEGER NOT NULL REFERENCES tag(id),
+    PRIMARY KEY (content_id, tag_id)
+) WITHOUT ROWID;
+
+-- Index for finding content by tag
+CREATE INDEX idx_music_content_tag_tag_id ON music_content_tag(tag_id);
@@ -0,0 +1,74 @@
+"""
+Schema migrations for the music_content database.
+music_content_schema.sql creates new databases; the DDL here brings older ones up to date,
+and is shared by fiddle_with_tagged_music.py and ingest_json_to_table.py.
+"""
+
+import sqlite3
+
+# Generated column definition, for databases created before it existed
+IS_UNTAGGED_COLUMN = "is_untagged INTEGER GENERATED ALWAYS AS (raw_tags IS NULL OR raw_tags = '') VIRTUAL"
+
+# Secondary indexes, which bulk loads drop and rebuild.
+# The youtube_id UNIQUE constraint index stays, since INSERT OR IGNORE probes it.
+SECONDARY_INDEXES = {
+    "idx_music_content_created_at": "CREATE INDEX IF NOT EXISTS idx_music_content_created_at ON music_content(created_at)",
+    "idx_music_content_is_untagged": (
+        "CREATE INDEX IF NOT EXISTS idx_music_content_is_untagged ON music_content(is_untagged, created_at DESC)"
+    ),
+}
+
+# Normalized tags; music_content.raw_tags is kept as a comma-separated display copy
+TAG_TABLES = [
+    """CREATE TABLE tag (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE
+    )""",
+    """CREATE TABLE music_content_tag (
+        content_id INTEGER NOT NULL REFERENCES music_content(id),
+        tag_id INTEGER NOT NULL REFERENCES tag(id),
+        PRIMARY KEY (content_id, tag_id)
+    ) WITHOUT ROWID""",
+    "CREATE INDEX idx_music_content_tag_tag_id ON music_content_tag(tag_id)",
+]
+
+def migrate_untagged_column(conn: sqlite3.Connection) -> None:
+    """Add the generated is_untagged column if missing, replacing the old partial index."""
+    columns = {row[1] for row in conn.execute("PRAGMA table_xinfo(music_content)")}
+    if "is_untagged" in columns:
+        return
+    with conn:
+        conn.execute("DROP INDEX IF EXISTS idx_music_content_untagged")
+        conn.execute(f"ALTER TABLE music_content ADD COLUMN {IS_UNTAGGED_COLUMN}")
+
+def migrate_tags(conn: sqlite3.Connection) -> None:
+    """Create the tag tables if missing, then link any raw_tags that have no tag rows yet."""
+    with conn:
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'tag'").fetchone():
+            for statement in TAG_TABLES:
+                conn.execute(statement)
+
+        # Rows from before the tag tables, or restored from a dump, only have raw_tags
+        links = []
+        for id, raw_tags in conn.execute("""
+            SELECT id, raw_tags FROM music_content
+            WHERE raw_tags <> ''
+              AND NOT EXISTS (SELECT 1 FROM music_content_tag WHERE content_id = music_content.id)
+        """):
+            links.extend((id, tag.strip()) for tag in raw_tags.split(',') if tag.strip())
+        if not links:
+            return
+
+        conn.executemany("INSERT OR IGNORE INTO tag (name) VALUES (?)", [(tag,) for _, tag in links])
+        conn.executemany(
+            "INSERT OR IGNORE INTO music_content_tag (content_id, tag_id) SELECT ?, id FROM tag WHERE name = ?",
+            links
+        )
+
+def migrate_schema(conn: sqlite3.Connection) -> None:
+    """Bring an existing database up to date with music_content_schema.sql."""
+    migrate_untagged_column(conn)
+    with conn:
+        for create_index in SECONDARY_INDEXES.values():
+            conn.execute(create_index)
+    migrate_tags(conn)